@@ -0,0 +1,75 @@
+"""
+Base45 encoding as described in RFC 9285, using lookup tables so the per character work is done by bytes.translate
+and bytes.join instead of Python loops.
+"""
+import sys
+from array import array
+from typing import Union
+
+BASE45_CHARSET = b"0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+
+# Marker for bytes that are not part of the charset
+_INVALID = 0xFF
+
+# Every 16-bit value to its 3 character encoding, least significant digit first
+_ENCODE_PAIRS = [
+    bytes((BASE45_CHARSET[x % 45], BASE45_CHARSET[x // 45 % 45], BASE45_CHARSET[x // 2025]))
+    for x in range(0x10000)
+]
+
+# Translation table from a character to its digit value
+_DECODE_TABLE = bytearray([_INVALID] * 256)
+for _value, _char in enumerate(BASE45_CHARSET):
+    _DECODE_TABLE[_char] = _value
+_DECODE_TABLE = bytes(_DECODE_TABLE)
+
+
+def b45encode(buf: bytes) -> bytes:
+    """
+    Encode bytes to Base45.
+    """
+    even = len(buf) & ~1
+    pairs = array("H", buf[:even])
+    if sys.byteorder == "little":
+        pairs.byteswap()
+
+    res = b"".join(map(_ENCODE_PAIRS.__getitem__, pairs))
+    if len(buf) & 1:
+        res += _ENCODE_PAIRS[buf[-1]][:2]
+    return res
+
+
+def b45decode(s: Union[bytes, str]) -> bytes:
+    """
+    Decode Base45 to bytes, raises ValueError for invalid input.
+    """
+    try:
+        if isinstance(s, str):
+            s = s.encode("ascii")
+        digits = s.translate(_DECODE_TABLE)
+    except (UnicodeEncodeError, AttributeError):
+        raise ValueError("Invalid base45 string")
+
+    length = len(digits)
+    full = length - length % 3
+    if length % 3 == 1 or _INVALID in digits:
+        raise ValueError("Invalid base45 string")
+
+    values = [
+        c + d * 45 + e * 2025
+        for c, d, e in zip(digits[0:full:3], digits[1:full:3], digits[2:full:3])
+    ]
+    if values and max(values) > 0xFFFF:
+        raise ValueError("Invalid base45 string")
+
+    pairs = array("H", values)
+    if sys.byteorder == "little":
+        pairs.byteswap()
+
+    res = pairs.tobytes()
+    if full != length:
+        x = digits[full] + digits[full + 1] * 45
+        if x > 0xFF:
+            raise ValueError("Invalid base45 string")
+        res += bytes((x,))
+    return res
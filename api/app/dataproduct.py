@@ -5,12 +5,26 @@ import httpx
 from async_lru import alru_cache
 
 from app.errors import TagsError
-from app.utils import fetch_json_file
+import app.utils as utils
+from settings import conf
 
 
-@alru_cache(maxsize=4)
+@alru_cache(maxsize=4, ttl=conf.DATASPACE_CACHE_TTL)
 async def get_dataspace_configuration(dataspace: str) -> dict:
-    return await fetch_json_file(f"https://{dataspace}/.well-known/dataspace/dataspace-configuration.json")
+    return await utils.fetch_json_file(f"https://{dataspace}/.well-known/dataspace/dataspace-configuration.json")
+
+
+@alru_cache(maxsize=4, ttl=conf.DATASPACE_CACHE_TTL)
+async def get_product_gateway_paths(dataspace: str) -> dict:
+    """
+    Get the data product definition paths from the product gateway's OpenAPI spec. Only the paths are kept, the
+    rest of the (large) document is thrown away.
+    """
+    config = await get_dataspace_configuration(dataspace)
+    gateway = config["product_gateway_url"]
+
+    pgw_openapi = await utils.fetch_json_file(f"{gateway}/openapi.json")
+    return pgw_openapi.get("paths", {})
 
 
 async def fetch_dataproduct(dataspace: str, product: str, source: str, payload: dict) -> httpx.Response:
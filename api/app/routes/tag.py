@@ -7,7 +7,7 @@ from starlette.responses import JSONResponse
 
 from app.errors import CannotSignInvalidIssuer, TagsError
 from app.responses import TagsErrorResponse
-from app.tag import make_cose_code, make_url_code, verify_code, fetch_metadata
+from app.tag import amake_cose_code, amake_url_code, verify_code, fetch_metadata
 from app.utils import domain_validator
 from settings import conf
 
@@ -104,7 +104,7 @@ async def metadata_v1(data: MetadataV1Request):
              )
 async def generate_secure_v1(data: GenerateSecureV1Request):
     try:
-        filename, image_content = make_cose_code(
+        filename, image_content = await amake_cose_code(
             iss=data.iss,
             product=data.product,
             id=data.id,
@@ -136,7 +136,7 @@ async def generate_secure_v1(data: GenerateSecureV1Request):
              tags=["tag"],
              )
 async def generate_url_v1(data: GenerateURLV1Request):
-    filename, image_content = make_url_code(
+    filename, image_content = await amake_url_code(
         iss=data.iss,
         product=data.product,
         id=data.id,
@@ -1,11 +1,37 @@
+from unittest.mock import patch
+
+import cbor2
+import cwt
 import pytest
-from httpx import AsyncClient
+from httpx import AsyncClient, RequestError
 from starlette import status
 
+import app.utils as utils
+from app.b45 import b45encode
 from app.responses import TagsErrorResponse
-from app.routes.tag import GenerateURLV1Request, GenerateSecureV1Request, VerifyV1Request
+from app.routes.tag import GenerateURLV1Request, GenerateSecureV1Request, MetadataV1Request, VerifyV1Request
+from app.tag import make_cose_code
 from settings import conf
-from testdata import TEST_CODE
+from testdata import (
+    TEST_CODE,
+    TEST_DATASPACE_CONFIGURATION_JSON,
+    TEST_EC_KID,
+    TEST_EC_PRIVATE_KEY,
+    TEST_FAKE_HOSTED_FILES,
+    TEST_JWKS_JSON,
+    TEST_PRODUCT_PASSPORT_JSON,
+    TEST_ROTATED_JWKS_JSON,
+)
+
+
+def make_es256_code(payloads: list[bytes]) -> str:
+    """
+    Sign a code with the ES256 test key, payloads is the list from the fake_make_image fixture.
+    """
+    private_key = cwt.COSEKey.from_pem(key_data=TEST_EC_PRIVATE_KEY, alg="ES256", kid=TEST_EC_KID)
+    with patch('app.tag.PRIVATE_KEY', private_key):
+        make_cose_code(conf.RSA_ISS, "demo-product", "abc-123-xyz", True)
+    return payloads[-1].decode("utf-8")
 
 
 # Test verifying
@@ -31,6 +57,85 @@ async def test_tag_verify_v1_invalid(client: AsyncClient, fake_hosting):
     assert resp.code == "signature_verification_failed"
 
 
+# Test that malformed COSE_Sign1 messages are reported instead of crashing
+@pytest.mark.parametrize("cose_sign1", [
+    [cbor2.dumps({1: -7}), [4, b"02"], cbor2.dumps({}), b"signature"],
+    [cbor2.dumps({1: -7}), b"\xa1\x04", cbor2.dumps({}), b"signature"],
+    [{1: -7}, {4: b"02"}, cbor2.dumps({}), b"signature"],
+    [cbor2.dumps({1: -7}), {4: b"02"}, {"iss": "tags.ioxio.dev"}, b"signature"],
+    [
+        cbor2.dumps({1: -7}),
+        {4: b"02"},
+        cbor2.dumps({"iss": "tags.ioxio.dev", "product": "demo-product", "id": "abc-123-xyz"}),
+        12345,
+    ],
+    [cbor2.dumps([-7]), {4: b"02"}, cbor2.dumps({}), b"signature"],
+], ids=[
+    "array-unprotected-header",
+    "bytes-unprotected-header",
+    "map-protected-header",
+    "map-payload",
+    "integer-signature",
+    "short-array-protected-header",
+])
+async def test_tag_verify_v1_malformed(client: AsyncClient, fake_hosting, cose_sign1: list):
+    cose_bytes = cbor2.dumps(cbor2.CBORTag(18, cose_sign1))
+    verify_params = VerifyV1Request(code="IT1:" + b45encode(cose_bytes).decode("ascii"))
+    r = await client.post("/tag/verify/v1/", json=verify_params.model_dump())
+    assert r.status_code == status.HTTP_400_BAD_REQUEST
+
+    resp = TagsErrorResponse(**r.json())
+    assert resp.code == "signature_verification_failed"
+
+
+# Test fetching the metadata, supported data products are described from the dataspace definitions
+async def test_tag_metadata_v1(client: AsyncClient, fake_hosting):
+    metadata_params = MetadataV1Request(iss="tags.ioxio.dev", product="demo-product")
+    r = await client.post("/tag/metadata/v1/", json=metadata_params.model_dump())
+    assert r.status_code == status.HTTP_200_OK
+
+    response = r.json()
+    assert response["logo_url"] == TEST_PRODUCT_PASSPORT_JSON["logo_url"]
+    assert response["product_dataspace"] == TEST_PRODUCT_PASSPORT_JSON["product_dataspace"]
+    # Data products without a definition on the dataspace are left out
+    assert response["supported_dataproducts"] == [
+        {
+            "name": "Charging history",
+            "description": "Charging history of a battery",
+            "path": "draft/Energy/Battery/ChargingHistory",
+            "source": "showroom",
+        },
+        {
+            "name": "Product data sheet",
+            "description": "Product data sheet of a battery",
+            "path": "draft/Energy/Battery/ProductDataSheet",
+            "source": "showroom",
+        },
+    ]
+
+
+# Test that failing to fetch from the dataspace is reported
+@pytest.mark.parametrize("failing_url", [
+    "https://sandbox.ioxio-dataspace.com/.well-known/dataspace/dataspace-configuration.json",
+    TEST_DATASPACE_CONFIGURATION_JSON["product_gateway_url"] + "/openapi.json",
+])
+async def test_tag_metadata_v1_dataspace_failed(client: AsyncClient, fake_hosting, failing_url: str):
+    fake_fetch_json_file = utils.fetch_json_file
+
+    async def _fetch_json_file(url) -> dict:
+        if url == failing_url:
+            raise RequestError(f"Failed to connect to {url}")
+        return await fake_fetch_json_file(url)
+
+    metadata_params = MetadataV1Request(iss="tags.ioxio.dev", product="demo-product")
+    with patch('app.utils.fetch_json_file', _fetch_json_file):
+        r = await client.post("/tag/metadata/v1/", json=metadata_params.model_dump())
+    assert r.status_code == status.HTTP_400_BAD_REQUEST
+
+    resp = TagsErrorResponse(**r.json())
+    assert resp.code == "failed_to_fetch_metadata"
+
+
 # Test generating simple URL tags (only validations etc.)
 async def test_fake_tag_generate_url_v1(client: AsyncClient, fake_make_image):
     generate_params = GenerateURLV1Request(
@@ -105,6 +210,106 @@ async def test_fake_tag_generate_secure_v1_valid(client: AsyncClient, fake_make_
     assert len(body) > 1024
 
 
+# Ensure codes signed with ES256 can be verified with the published EC key
+async def test_fake_tag_generate_secure_v1_es256_verify(client: AsyncClient, fake_make_image, fake_hosting):
+    generate_params = GenerateSecureV1Request(
+        iss=conf.RSA_ISS,
+        product="demo-product",
+        id="abc-123-xyz",
+        valid=True
+    )
+
+    private_key = cwt.COSEKey.from_pem(key_data=TEST_EC_PRIVATE_KEY, alg="ES256", kid=TEST_EC_KID)
+    with patch('app.tag.PRIVATE_KEY', private_key):
+        r = await client.post("/tag/generate/secure/v1/", json=generate_params.model_dump())
+    assert r.status_code == status.HTTP_200_OK
+
+    verify_params = VerifyV1Request(code=fake_make_image[0].decode("utf-8"))
+    r = await client.post("/tag/verify/v1/", json=verify_params.model_dump())
+    assert r.status_code == status.HTTP_204_NO_CONTENT
+
+
+# Ensure codes generated with invalid signatures parse fine, but fail the signature check
+async def test_fake_tag_generate_secure_v1_unsigned_verify(client: AsyncClient, fake_make_image, fake_hosting):
+    generate_params = GenerateSecureV1Request(
+        iss=conf.RSA_ISS,
+        product="demo-product",
+        id="abc-123-xyz",
+        valid=False
+    )
+
+    r = await client.post("/tag/generate/secure/v1/", json=generate_params.model_dump())
+    assert r.status_code == status.HTTP_200_OK
+
+    verify_params = VerifyV1Request(code=fake_make_image[0].decode("utf-8"))
+    r = await client.post("/tag/verify/v1/", json=verify_params.model_dump())
+    assert r.status_code == status.HTTP_400_BAD_REQUEST
+
+    resp = TagsErrorResponse(**r.json())
+    assert resp.code == "invalid_signature_jwks_failed"
+
+
+# Ensure a key the issuer added after the JWKS was cached is found
+@patch.object(conf, "JWKS_REFRESH_INTERVAL", 0)
+async def test_tag_verify_v1_new_key(client: AsyncClient, fake_make_image, fake_hosting):
+    verify_params = VerifyV1Request(code=make_es256_code(fake_make_image))
+    jwks_uri = TEST_PRODUCT_PASSPORT_JSON["jwks_uri"]
+
+    with patch.dict(TEST_FAKE_HOSTED_FILES, {jwks_uri: {"keys": TEST_JWKS_JSON["keys"][:1]}}):
+        r = await client.post("/tag/verify/v1/", json=verify_params.model_dump())
+    assert r.status_code == status.HTTP_400_BAD_REQUEST
+    assert TagsErrorResponse(**r.json()).code == "invalid_signature_jwks_invalid_key"
+
+    r = await client.post("/tag/verify/v1/", json=verify_params.model_dump())
+    assert r.status_code == status.HTTP_204_NO_CONTENT
+
+
+# Ensure a key the issuer rotated after it was cached is replaced
+@patch.object(conf, "JWKS_REFRESH_INTERVAL", 0)
+async def test_tag_verify_v1_rotated_key(client: AsyncClient, fake_make_image, fake_hosting):
+    verify_params = VerifyV1Request(code=make_es256_code(fake_make_image))
+    jwks_uri = TEST_PRODUCT_PASSPORT_JSON["jwks_uri"]
+
+    with patch.dict(TEST_FAKE_HOSTED_FILES, {jwks_uri: TEST_ROTATED_JWKS_JSON}):
+        r = await client.post("/tag/verify/v1/", json=verify_params.model_dump())
+    assert r.status_code == status.HTTP_400_BAD_REQUEST
+    assert TagsErrorResponse(**r.json()).code == "invalid_signature_jwks_failed"
+
+    r = await client.post("/tag/verify/v1/", json=verify_params.model_dump())
+    assert r.status_code == status.HTTP_204_NO_CONTENT
+
+
+# Ensure a stream of codes with bad signatures doesn't keep fetching the JWKS, or drop the other cached keys
+async def test_tag_verify_v1_invalid_signature_refresh_limit(client: AsyncClient, fake_make_image, fake_hosting):
+    make_cose_code(conf.RSA_ISS, "demo-product", "abc-123-xyz", False)
+    invalid_params = VerifyV1Request(code=fake_make_image[0].decode("utf-8"))
+    valid_params = VerifyV1Request(code=TEST_CODE)
+
+    fetched = []
+    fake_fetch_json_file = utils.fetch_json_file
+
+    async def _fetch_json_file(url) -> dict:
+        fetched.append(url)
+        return await fake_fetch_json_file(url)
+
+    with patch('app.utils.fetch_json_file', _fetch_json_file):
+        r = await client.post("/tag/verify/v1/", json=valid_params.model_dump())
+        assert r.status_code == status.HTTP_204_NO_CONTENT
+
+        for _ in range(3):
+            r = await client.post("/tag/verify/v1/", json=invalid_params.model_dump())
+            assert r.status_code == status.HTTP_400_BAD_REQUEST
+            assert TagsErrorResponse(**r.json()).code == "invalid_signature_jwks_failed"
+
+        r = await client.post("/tag/verify/v1/", json=valid_params.model_dump())
+        assert r.status_code == status.HTTP_204_NO_CONTENT
+
+    # The passport and JWKS once for the valid code, and the JWKS once more for the first invalid one
+    jwks_uri = TEST_PRODUCT_PASSPORT_JSON["jwks_uri"]
+    assert fetched.count(jwks_uri) == 2
+    assert len(fetched) == 3
+
+
 #
 # Slow actual image generation tests
 #
@@ -128,6 +333,25 @@ async def test_tag_generate_url_v1(client: AsyncClient):
     assert len(body) > 1024
 
 
+# Test generating tags with a fixed mask pattern
+@pytest.mark.slow
+async def test_tag_generate_url_v1_mask_pattern(client: AsyncClient):
+    generate_params = GenerateURLV1Request(
+        iss="arbitrary.example.com",
+        product="amazing-product",
+        id="abc123-serial-xyz",
+    )
+
+    with patch.object(conf, "QR_MASK_PATTERN", 3):
+        r = await client.post("/tag/generate/url/v1/", json=generate_params.model_dump())
+    assert r.status_code == status.HTTP_200_OK
+    assert r.headers.get("content-type", "") == "image/png"
+
+    # >= 1kB probably means an actual image was sent
+    body = r.read()
+    assert len(body) > 1024
+
+
 # Ensure we can't sign for arbitrary domains
 @pytest.mark.slow
 async def test_tag_generate_secure_v1_invalid_iss(client: AsyncClient):
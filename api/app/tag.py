@@ -1,9 +1,16 @@
 import asyncio
+import importlib
+import math
+import os
 import re
+import string
+import time
 import unicodedata
-from copy import copy
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
 from io import BytesIO
-from typing import Literal
+from typing import Literal, Optional, Union
 from urllib.parse import quote_plus
 from PIL import Image, ImageDraw, ImageOps
 import cairosvg
@@ -12,20 +19,22 @@ from pathlib import Path
 import cbor2
 import cwt
 import qrcode
-from base45 import b45encode, b45decode
+from async_lru import alru_cache
 from cwt.cwt import COSEKeyInterface
 from httpx import HTTPError
-from pydantic import BaseModel
-from qrcode.image.styledpil import StyledPilImage
-from qrcode.image.styles.colormasks import SolidFillColorMask
+from pydantic import BaseModel, ConfigDict
 
 import app.routes.tag as tag
-from app.dataproduct import get_dataspace_configuration
+import app.utils as utils
+from app.b45 import b45encode, b45decode
+from app.dataproduct import get_product_gateway_paths
 from app.errors import CannotSignInvalidIssuer, TagsError
 from app.log import logger
-from app.utils import fetch_json_file
 from settings import conf
-from testdata import INVALID_KEY_DATA, DUMMY_JWK
+
+# cbor2 quietly falls back to its much slower pure Python implementation if the C extension is missing
+if cbor2.loads.__module__ != "_cbor2":
+    logger.warning("cbor2 C extension is not available, using the slower pure Python implementation")
 
 api_root = Path(__file__).parent.parent.absolute()
 signed_tag_frame = str(api_root) + "/tags_frame_signed.svg"
@@ -34,15 +43,50 @@ simple_tag_frame = str(api_root) + "/tags_frame_simple.svg"
 # COSE algorithms from technical format to string argment format
 # https://python-cwt.readthedocs.io/en/stable/algorithms.html#cose-algorithms
 ALGS = {
-    -257: "RS256"
+    -7: "ES256",
+    -257: "RS256",
 }
 
-RSA_PRIVATE_KEY = cwt.COSEKey.from_pem(key_data=conf.RSA_PRIVATE_KEY, alg="RS256", kid=conf.RSA_KID)
-INVALID_PRIVATE_KEY = cwt.COSEKey.from_pem(key_data=INVALID_KEY_DATA, alg="RS256", kid=conf.RSA_KID)
+# ES256 is much cheaper to sign and verify, RS256 is kept as a fallback when no EC key is configured
+if conf.EC_PRIVATE_KEY:
+    PRIVATE_KEY = cwt.COSEKey.from_pem(key_data=conf.EC_PRIVATE_KEY, alg="ES256", kid=conf.EC_KID)
+else:
+    # RSA PEM keys always carry the CRT parameters, and cryptography refuses to load keys where they don't match,
+    # so signing always gets the fast CRT path
+    PRIVATE_KEY = cwt.COSEKey.from_pem(key_data=conf.RSA_PRIVATE_KEY, alg="RS256", kid=conf.RSA_KID)
+
+# The COSE instance holds no per message state, so a single one is shared for signing and verifying
+COSE_CODEC = cwt.COSE(alg_auto_inclusion=True, kid_auto_inclusion=True)
+
+# CBOR tag of COSE_Sign1 messages
+COSE_SIGN1_TAG = 18
+
+# Codes with invalid signatures get random bytes of the same length as a real signature instead
+SIGNATURE_LENGTH = len(PRIVATE_KEY.sign(b""))
+
+# Generating tags is CPU bound (signing, QR rendering, PNG compression), so the API does it in worker processes to
+# keep the event loop free, see start_cpu_pool. Without a pool, e.g. in tests, tags are generated in-process.
+CPU_POOL: Optional[ProcessPoolExecutor] = None
+
+# Each worker loads cairo, PIL, cwt and the Base45 tables, so only a few are started unless TAG_WORKERS says otherwise
+DEFAULT_MAX_TAG_WORKERS = 2
+
+# When each JWKS was last fetched again ahead of its cache TTL, by refresh_jwks
+JWKS_REFRESHED_AT: dict[str, float] = {}
 
 # Version prefix for all tags
 IOXIO_TAGS_HEADER = "IT1:".encode("utf-8")
 
+# Patterns for slugify
+SLUG_INVALID_CHARS = re.compile(r'[^.\w\s-]')
+SLUG_DASHES = re.compile(r'[-\s]+')
+
+# Characters quote_plus never escapes
+URL_SAFE_CHARS = frozenset(string.ascii_letters + string.digits + "-._~")
+
+# Maps QR module values to grayscale, light (0) to white and dark (1) to black
+QR_MODULE_PIXELS = bytes([255, 0]) + bytes(254)
+
 CORRECTIONS = {
     "L": qrcode.ERROR_CORRECT_L,
     "M": qrcode.ERROR_CORRECT_M,
@@ -52,24 +96,32 @@ CORRECTIONS = {
 
 
 class CodePayload(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     iss: str
     product: str
     id: str
 
 
 class CodeBasics(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     payload: CodePayload
     alg: str
     kid: str
 
 
 class ProductPassport(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     jwks_uri: str
     logo_url: str
     product_dataspace: str
 
 
 class ProductMetadata(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     names: dict[str, str]
     image_url: str
     supported_dataproducts: list[dict]
@@ -91,13 +143,27 @@ def get_product_metadata_uri(iss: str, product: str):
     return f"{base}/.well-known/product-passport/products/{product}.json"
 
 
-def ioxio_tag_str_to_cose_bytes(code: str) -> bytes:
+@alru_cache(maxsize=256, ttl=conf.METADATA_CACHE_TTL)
+async def get_product_passport(iss: str) -> ProductPassport:
+    return ProductPassport.model_validate(await utils.fetch_json_file(get_product_passport_uri(iss)))
+
+
+@alru_cache(maxsize=256, ttl=conf.METADATA_CACHE_TTL)
+async def get_product_metadata(iss: str, product: str) -> ProductMetadata:
+    return ProductMetadata.model_validate(await utils.fetch_json_file(get_product_metadata_uri(iss, product)))
+
+
+def ioxio_tag_str_to_cose_bytes(code: Union[str, bytes]) -> bytes:
     """
     IOXIO Tag strings start with `IT1:` which is followed by Base45 encoded COSE bytes.
-    :param str code: Original tag string
+    :param str|bytes code: Original tag string, or its bytes as received
     :return bytes: Base45 decoded COSE bytes
     """
-    if code.startswith("IT1:"):
+    if isinstance(code, str):
+        # Anything outside of ASCII will fail the Base45 decode anyway
+        code = code.encode("utf-8")
+
+    if code[:4] == IOXIO_TAGS_HEADER:
         code_b45 = code[4:]
     else:
         raise TagsError(
@@ -114,78 +180,113 @@ def ioxio_tag_str_to_cose_bytes(code: str) -> bytes:
         )
 
 
-def cose_parse_insecure(cose_bytes: bytes) -> CodeBasics:
+def cose_loads(cose_bytes: bytes) -> cbor2.CBORTag:
     """
-    Parse the important details from the COSE bytes that are required for further processing. Do NOT verify anything.
+    Parse the COSE_Sign1 structure from the COSE bytes, so the rest of the processing doesn't need to parse it again.
     """
-    msg = cwt.COSEMessage.loads(cose_bytes)
+    try:
+        msg = cbor2.loads(cose_bytes)
+    except cbor2.CBORDecodeError as e:
+        raise TagsError(
+            error=str(e),
+            code="signature_verification_failed",
+        )
+
+    if not isinstance(msg, cbor2.CBORTag) or msg.tag != COSE_SIGN1_TAG or \
+            not isinstance(msg.value, list) or len(msg.value) != 4:
+        raise TagsError(
+            error="Not an IOXIO Tag code, invalid COSE_Sign1 structure.",
+            code="signature_verification_failed",
+        )
 
-    # Extract alg and Key ID
-    alg = ALGS[msg.protected[1]]
-    kid = msg.unprotected[4]
+    # [protected header bytes, unprotected header map, payload bytes, signature bytes]
+    protected, unprotected, payload, signature = msg.value
+    if not isinstance(protected, bytes) or not isinstance(unprotected, dict) or \
+            not isinstance(payload, bytes) or not isinstance(signature, bytes):
+        raise TagsError(
+            error="Not an IOXIO Tag code, invalid COSE_Sign1 structure.",
+            code="signature_verification_failed",
+        )
+    return msg
 
-    # Pretend like we have a key for this code
-    dummy_jwk = copy(DUMMY_JWK)
-    dummy_jwk["kid"] = kid
-    dummy_jwk["alg"] = alg
 
-    dummy_key = cwt.COSEKey.from_jwk(dummy_jwk)
-    # Override "verify" to always say it is ok
-    dummy_key.verify = lambda x, y: True
+def cose_parse_insecure(msg: cbor2.CBORTag) -> CodeBasics:
+    """
+    Parse the important details from the COSE message that are required for further processing. Do NOT verify
+    anything.
+    """
+    protected, unprotected, payload, _ = msg.value
 
     try:
-        payload = cwt.decode(cose_bytes, dummy_key, no_verify=True)
+        # Extract alg and Key ID
+        alg = ALGS[cbor2.loads(protected)[1]]
+        kid = unprotected[4]
+
+        # Nothing is verified here, so the payload can be read straight from the message
+        payload = cbor2.loads(payload)
         return CodeBasics(
             alg=alg,
             kid=kid,
-            payload=CodePayload(**payload)
+            payload=CodePayload.model_validate(payload)
         )
-    except cwt.CWTError as e:
+    except (cbor2.CBORDecodeError, IndexError, KeyError, TypeError, ValueError) as e:
         raise TagsError(
             error=str(e),
             code="signature_verification_failed",
         )
 
 
-def cose_verify(cose_bytes: bytes, key: COSEKeyInterface):
+def cose_verify(msg: cbor2.CBORTag, key: COSEKeyInterface):
     """
     Verify COSE signature, raises exceptions if it fails.
     """
-    cwt.decode(cose_bytes, key)
+    COSE_CODEC.decode(msg, key)
 
 
-async def verify_code(code_b45: str):
-    cose_bytes = ioxio_tag_str_to_cose_bytes(code_b45)
-    basics = cose_parse_insecure(cose_bytes)
+def find_jwk(jwks: dict, kid: str, alg: str) -> Optional[dict]:
+    return next((jwk for jwk in jwks["keys"] if jwk["kid"] == kid and jwk["alg"] == alg), None)
 
-    try:
-        product_passport = ProductPassport(**await fetch_json_file(get_product_passport_uri(basics.payload.iss)))
-    except HTTPError:
-        raise TagsError(
-            error="Signature verification failed, couldn't read metadata from domain.",
-            code="invalid_issuer_cannot_read_product_passport_metadata",
-        )
 
+def refresh_jwks(jwks_uri: str) -> bool:
+    """
+    Drop the cached JWKS so the next lookup fetches it again, unless that was already done within
+    JWKS_REFRESH_INTERVAL. Returns if the JWKS was dropped.
+    """
+    now = time.monotonic()
+    if now - JWKS_REFRESHED_AT.get(jwks_uri, -math.inf) < conf.JWKS_REFRESH_INTERVAL:
+        return False
+
+    JWKS_REFRESHED_AT[jwks_uri] = now
+    utils.fetch_json_file_cached.cache_invalidate(jwks_uri)
+    return True
+
+
+@alru_cache(maxsize=128, ttl=conf.METADATA_CACHE_TTL)
+async def get_cose_key(jwks_uri: str, kid: str, alg: str) -> COSEKeyInterface:
+    """
+    Find the key the issuer has published for the kid and alg, and build a COSE key out of it.
+    """
     try:
-        jwks = await fetch_json_file(product_passport.jwks_uri)
+        jwks = await utils.fetch_json_file_cached(jwks_uri)
+        jwk = find_jwk(jwks, kid, alg)
+        if jwk is None and refresh_jwks(jwks_uri):
+            # The issuer might have added the key after the JWKS was cached
+            jwks = await utils.fetch_json_file_cached(jwks_uri)
+            jwk = find_jwk(jwks, kid, alg)
     except HTTPError:
         raise TagsError(
             error="Signature verification failed, couldn't read JWKS keys from domain.",
             code="invalid_issuer_cannot_read_jwks",
         )
 
-    try:
-        # Find the correct JWK
-        jwk = next(jwk for jwk in jwks["keys"] if jwk["kid"] == basics.kid and jwk["alg"] == basics.alg)
-        cose_key = cwt.COSEKey.from_jwk(jwk)
-
-        # Decode and verify
-        cose_verify(cose_bytes, cose_key)
-    except StopIteration:
+    if jwk is None:
         raise TagsError(
             error="Signature verification failed, matching key was not found.",
             code="invalid_signature_jwks_invalid_key",
         )
+
+    try:
+        return cwt.COSEKey.from_jwk(jwk)
     except cwt.CWTError:
         raise TagsError(
             error="Signature verification failed.",
@@ -193,17 +294,58 @@ async def verify_code(code_b45: str):
         )
 
 
-async def fetch_metadata(iss: str, product: str):
-    product_passport_uri = get_product_passport_uri(iss)
-    product_uri = get_product_metadata_uri(iss, product)
+async def verify_code(code_b45: Union[str, bytes]):
+    cose_bytes = ioxio_tag_str_to_cose_bytes(code_b45)
+    cose_msg = cose_loads(cose_bytes)
+    basics = cose_parse_insecure(cose_msg)
+
     try:
-        product_passport, product_metadata = await asyncio.gather(
-            fetch_json_file(product_passport_uri),
-            fetch_json_file(product_uri),
+        product_passport = await get_product_passport(basics.payload.iss)
+    except HTTPError:
+        raise TagsError(
+            error="Signature verification failed, couldn't read metadata from domain.",
+            code="invalid_issuer_cannot_read_product_passport_metadata",
         )
 
-        product_passport = ProductPassport(**product_passport)
-        product_metadata = ProductMetadata(**product_metadata)
+    jwks_uri = product_passport.jwks_uri
+    cose_key = await get_cose_key(jwks_uri, basics.kid, basics.alg)
+
+    try:
+        # Verify the already parsed message
+        cose_verify(cose_msg, cose_key)
+        return
+    except (cwt.CWTError, ValueError):
+        pass
+
+    # The issuer might have rotated the key, so check once more against a freshly fetched JWKS. Anyone can send
+    # codes with bad signatures, so this is rate limited by refresh_jwks.
+    if refresh_jwks(jwks_uri):
+        get_cose_key.cache_invalidate(jwks_uri, basics.kid, basics.alg)
+        cose_key = await get_cose_key(jwks_uri, basics.kid, basics.alg)
+        try:
+            cose_verify(cose_msg, cose_key)
+            return
+        except (cwt.CWTError, ValueError):
+            pass
+
+    raise TagsError(
+        error="Signature verification failed.",
+        code="invalid_signature_jwks_failed",
+    )
+
+
+async def fetch_metadata(iss: str, product: str):
+    async def _fetch_passport_and_paths() -> (ProductPassport, dict):
+        # The dataspace definitions only depend on the passport, so don't wait for the product metadata
+        passport = await get_product_passport(iss)
+        paths = await get_product_gateway_paths(passport.product_dataspace)
+        return passport, paths
+
+    try:
+        (product_passport, definition_paths), product_metadata = await asyncio.gather(
+            _fetch_passport_and_paths(),
+            get_product_metadata(iss, product),
+        )
     except HTTPError:
         logger.exception(f"Failed to fetch metadata for {iss}")
         raise TagsError(
@@ -211,13 +353,6 @@ async def fetch_metadata(iss: str, product: str):
             code="failed_to_fetch_metadata",
         )
 
-    config = await get_dataspace_configuration(product_passport.product_dataspace)
-    gateway = config["product_gateway_url"]
-
-    pgw_openapi = await fetch_json_file(f"{gateway}/openapi.json")
-
-    definition_paths = pgw_openapi.get("paths", {})
-
     return tag.MetadataV1Response(
         logo_url=product_passport.logo_url,
         product_dataspace=product_passport.product_dataspace,
@@ -244,12 +379,14 @@ def slugify(value: str, allow_unicode=False) -> str:
     trailing whitespace, dashes, and underscores.
     """
     value = str(value)
-    if allow_unicode:
-        value = unicodedata.normalize('NFKC', value)
-    else:
-        value = unicodedata.normalize('NFKD', value).encode('ascii', 'ignore').decode('ascii')
-    value = re.sub(r'[^.\w\s-]', '', value.lower())
-    return re.sub(r'[-\s]+', '-', value).strip('-_')
+    # Plain ASCII is already normalized, so only other input needs the round trip
+    if not value.isascii():
+        if allow_unicode:
+            value = unicodedata.normalize('NFKC', value)
+        else:
+            value = unicodedata.normalize('NFKD', value).encode('ascii', 'ignore').decode('ascii')
+    value = SLUG_INVALID_CHARS.sub('', value.lower())
+    return SLUG_DASHES.sub('-', value).strip('-_')
 
 
 def make_image_filename(iss: str, product: str, id: str, security: str) -> str:
@@ -257,17 +394,50 @@ def make_image_filename(iss: str, product: str, id: str, security: str) -> str:
 
 
 def make_image(payload: bytes, frame_type: Literal["simple", "secure"]) -> bytes:
-    qr = qrcode.QRCode(error_correction=CORRECTIONS[conf.QR_CORRECTION_LEVEL], border=0)
-    qr.add_data(payload)
-
-    img = qr.make_image(
-        color_mask=SolidFillColorMask(
-            front_color=conf.QR_FOREGROUND,
-            back_color=conf.QR_BACKGROUND,
-        ),
-        image_factory=StyledPilImage,
+    return render_image(
+        payload,
+        frame_type,
+        CORRECTIONS[conf.QR_CORRECTION_LEVEL],
+        conf.QR_MASK_PATTERN,
+        conf.QR_FOREGROUND,
+        conf.QR_BACKGROUND,
     )
 
+
+def make_qr_image(
+        qr: qrcode.QRCode,
+        front_color: tuple[int, int, int],
+        back_color: tuple[int, int, int],
+) -> Image.Image:
+    """
+    Draw the QR code, the same image as StyledPilImage with a SolidFillColorMask makes. It's built from the whole
+    module matrix at once instead of drawing each module separately, one pixel per module is scaled up to the box
+    size and then colored.
+    """
+    size = qr.modules_count
+    modules = b"".join(map(bytes, qr.modules)).translate(QR_MODULE_PIXELS)
+    img = Image.frombytes("L", (size, size), modules)
+    img = img.resize((size * qr.box_size, size * qr.box_size), Image.NEAREST)
+    return ImageOps.colorize(img, black=front_color, white=back_color)
+
+
+@lru_cache(maxsize=conf.QR_IMAGE_CACHE_SIZE)
+def render_image(
+        payload: bytes,
+        frame_type: Literal["simple", "secure"],
+        error_correction: int,
+        mask_pattern: Optional[int],
+        front_color: tuple[int, int, int],
+        back_color: tuple[int, int, int],
+) -> bytes:
+    """
+    Render the framed QR code image. The output only depends on the arguments, so repeated payloads are cached.
+    """
+    qr = qrcode.QRCode(error_correction=error_correction, mask_pattern=mask_pattern, border=0)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    img = make_qr_image(qr, front_color, back_color)
+
     # Get the dimensions of the image in pixels
     img_width, img_height = img.size
 
@@ -306,19 +476,29 @@ def make_image(payload: bytes, frame_type: Literal["simple", "secure"]) -> bytes
     # Paste the QR code onto the new image at the calculated position
     new_image.paste(img, (x_position, y_position))
 
-    # Convert the PIL image to bytes
+    # Convert the PIL image to bytes, using the fastest zlib level as encoding time matters more than size here
     container = BytesIO()
-    new_image.save(container, format="PNG")
+    new_image.save(container, format="PNG", optimize=False, compress_level=1)
     return container.getvalue()
 
 
+def make_invalid_cose(cbor_data: bytes) -> bytes:
+    """
+    Build a COSE_Sign1 message like a signed one, but with random bytes as the signature, as it's supposed to fail
+    verification anyway.
+    """
+    msg = cbor2.CBORTag(COSE_SIGN1_TAG, [
+        cbor2.dumps({1: PRIVATE_KEY.alg}),
+        {4: PRIVATE_KEY.kid},
+        cbor_data,
+        os.urandom(SIGNATURE_LENGTH),
+    ])
+    return cbor2.dumps(msg)
+
+
 def make_cose_code(iss: str, product: str, id: str, valid: bool) -> (str, bytes):
-    if valid:
-        if iss != conf.RSA_ISS:
-            raise CannotSignInvalidIssuer()
-        private_key = RSA_PRIVATE_KEY
-    else:
-        private_key = INVALID_PRIVATE_KEY
+    if valid and iss != conf.RSA_ISS:
+        raise CannotSignInvalidIssuer()
 
     if valid:
         logger.info(f"Making a COSE signed IOXIO Tag for iss {iss}, product {product}, id {id}, with a valid signature")
@@ -333,8 +513,10 @@ def make_cose_code(iss: str, product: str, id: str, valid: bool) -> (str, bytes)
     }
 
     cbor_data = cbor2.dumps(raw_data)
-    cose = cwt.COSE(alg_auto_inclusion=True, kid_auto_inclusion=True)
-    cose_encoded = cose.encode(cbor_data, private_key)
+    if valid:
+        cose_encoded = COSE_CODEC.encode(cbor_data, PRIVATE_KEY)
+    else:
+        cose_encoded = make_invalid_cose(cbor_data)
     payload = IOXIO_TAGS_HEADER + b45encode(cose_encoded)
 
     if valid:
@@ -345,15 +527,120 @@ def make_cose_code(iss: str, product: str, id: str, valid: bool) -> (str, bytes)
     return filename, make_image(payload, "secure")
 
 
+def quote_url_part(value: str) -> str:
+    """
+    Same as quote_plus, but skips it for the common case of values that don't need any escaping.
+    """
+    if URL_SAFE_CHARS.issuperset(value):
+        return value
+    return quote_plus(value)
+
+
 def make_url_code(iss: str, product: str, id: str) -> (str, bytes):
     logger.info(f"Making a simple IOXIO Tag for iss {iss}, product {product}, id {id}, in URL format")
 
     url = "https://tags.ioxio.dev/q/"
     url += "/".join([
-        quote_plus(iss),
-        quote_plus(product),
-        quote_plus(id),
+        quote_url_part(iss),
+        quote_url_part(product),
+        quote_url_part(id),
     ])
 
     filename = make_image_filename(iss, product, id, "simple")
     return filename, make_image(url.encode("utf-8"), "simple")
+
+
+def get_tag_worker_count() -> int:
+    """
+    How many worker processes to start, TAG_WORKERS if it's set.
+    """
+    if conf.TAG_WORKERS is not None:
+        return conf.TAG_WORKERS
+
+    # In containers os.cpu_count() is the CPU count of the host, the affinity mask at least follows cpusets
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    return min(cpus, DEFAULT_MAX_TAG_WORKERS)
+
+
+def start_cpu_pool():
+    """
+    Start the worker processes for generating tags, unless TAG_WORKERS is 0.
+    """
+    global CPU_POOL
+    workers = get_tag_worker_count()
+    if workers == 0 or CPU_POOL is not None:
+        return
+
+    # The workers import the routes first, as importing this module on its own is a circular import
+    CPU_POOL = ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=importlib.import_module,
+        initargs=("app.routes.tag",),
+    )
+
+
+def stop_cpu_pool():
+    global CPU_POOL
+    if CPU_POOL is not None:
+        CPU_POOL.shutdown()
+        CPU_POOL = None
+
+
+def replace_cpu_pool(broken_pool: ProcessPoolExecutor):
+    """
+    Start a new pool in place of a broken one, unless another request already did.
+    """
+    global CPU_POOL
+    if CPU_POOL is broken_pool:
+        broken_pool.shutdown(wait=False)
+        CPU_POOL = None
+        start_cpu_pool()
+
+
+async def run_cpu_bound(func, *args):
+    pool = CPU_POOL
+    if pool is None:
+        return func(*args)
+
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(pool, func, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. it was killed for running out of memory), which leaves the whole pool unusable
+        logger.exception("Tag worker pool is broken, starting a new one")
+        replace_cpu_pool(pool)
+        return await loop.run_in_executor(CPU_POOL, func, *args)
+
+
+async def amake_cose_code(iss: str, product: str, id: str, valid: bool) -> (str, bytes):
+    return await run_cpu_bound(make_cose_code, iss, product, id, valid)
+
+
+async def amake_url_code(iss: str, product: str, id: str) -> (str, bytes):
+    return await run_cpu_bound(make_url_code, iss, product, id)
+
+
+def make_cose_codes(items: list[tuple[str, str, str, bool]]) -> list[tuple[str, bytes]]:
+    """
+    Make a COSE signed tag for each (iss, product, id, valid) in items, in the same order.
+    """
+    return [make_cose_code(iss, product, id, valid) for iss, product, id, valid in items]
+
+
+async def amake_cose_codes(items: list[tuple[str, str, str, bool]]) -> list[tuple[str, bytes]]:
+    """
+    Same as make_cose_codes, but with the items split into one batch per worker process, so the per call overhead
+    of the pool is paid once per batch instead of once per tag.
+    """
+    if CPU_POOL is None:
+        return make_cose_codes(items)
+
+    workers = get_tag_worker_count()
+    batch_size = max(1, math.ceil(len(items) / workers))
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+    results = await asyncio.gather(*(run_cpu_bound(make_cose_codes, batch) for batch in batches))
+    return [result for batch in results for result in batch]
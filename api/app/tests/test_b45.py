@@ -0,0 +1,46 @@
+import pytest
+
+from app.b45 import b45decode, b45encode
+
+# Test vectors from RFC 9285
+RFC_VECTORS = [
+    (b"AB", b"BB8"),
+    (b"Hello!!", b"%69 VD92EX0"),
+    (b"base-45", b"UJCLQE7W581"),
+    (b"ietf!", b"QED8WEX0"),
+]
+
+
+@pytest.mark.parametrize("data,encoded", RFC_VECTORS)
+def test_b45encode(data: bytes, encoded: bytes):
+    assert b45encode(data) == encoded
+
+
+@pytest.mark.parametrize("data,encoded", RFC_VECTORS)
+def test_b45decode(data: bytes, encoded: bytes):
+    assert b45decode(encoded) == data
+    assert b45decode(encoded.decode("ascii")) == data
+
+
+# Ensure every byte value and odd and even lengths survive the round trip
+def test_b45_round_trip():
+    data = bytes(range(256)) + bytes(reversed(range(256)))
+    for length in range(len(data)):
+        assert b45decode(b45encode(data[:length])) == data[:length]
+
+
+@pytest.mark.parametrize("encoded", [
+    "GGW",  # 65535 + 1 doesn't fit in two bytes
+    "ZZZ",
+    "ZZ",  # 1610 doesn't fit in one byte
+    "A",  # Length 1 mod 3 can't be decoded
+    "BB8A",
+    "bb8",  # Lowercase isn't part of the alphabet
+    "BB8!",
+    "BB8ä",
+    b"\x00\x00\x00",
+    12345,
+])
+def test_b45decode_invalid(encoded):
+    with pytest.raises(ValueError):
+        b45decode(encoded)
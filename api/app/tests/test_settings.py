@@ -0,0 +1,22 @@
+import pytest
+from pydantic import ValidationError
+
+from settings import Settings
+
+
+# Ensure invalid QR mask patterns are rejected when the settings are loaded, instead of failing every generated tag
+@pytest.mark.parametrize("mask_pattern", [-1, 8, 9])
+def test_qr_mask_pattern_invalid(mask_pattern: int):
+    with pytest.raises(ValidationError):
+        Settings(QR_MASK_PATTERN=mask_pattern)
+
+
+@pytest.mark.parametrize("mask_pattern", [None, 0, 7])
+def test_qr_mask_pattern(mask_pattern: int):
+    assert Settings(QR_MASK_PATTERN=mask_pattern).QR_MASK_PATTERN == mask_pattern
+
+
+# Ensure a negative worker count is rejected when the settings are loaded, instead of failing at startup
+def test_tag_workers_invalid():
+    with pytest.raises(ValidationError):
+        Settings(TAG_WORKERS=-1)
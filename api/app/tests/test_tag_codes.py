@@ -0,0 +1,118 @@
+from concurrent.futures import Executor, Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest.mock import patch
+
+import pytest
+import qrcode
+from PIL import ImageChops
+from qrcode.image.styledpil import StyledPilImage
+from qrcode.image.styles.colormasks import SolidFillColorMask
+
+import app.tag
+from app.errors import TagsError
+from app.tag import (
+    CORRECTIONS,
+    amake_cose_codes,
+    ioxio_tag_str_to_cose_bytes,
+    make_image_filename,
+    make_qr_image,
+    run_cpu_bound,
+    slugify,
+)
+from settings import conf
+from testdata import TEST_CODE
+
+
+# Ensure batches of codes are split between the workers and come back in the same order
+async def test_fake_amake_cose_codes_batches(fake_make_image):
+    items = [
+        (conf.RSA_ISS if i % 2 else "another." + conf.RSA_ISS, "amazing-product", f"serial-{i}", bool(i % 2))
+        for i in range(7)
+    ]
+    batches = []
+
+    async def _run_cpu_bound(func, *args):
+        batches.append(args[0])
+        return func(*args)
+
+    # Any pool makes amake_cose_codes batch, the work itself is done in this process
+    with patch('app.tag.CPU_POOL', object()), patch('app.tag.run_cpu_bound', _run_cpu_bound), \
+            patch.object(conf, "TAG_WORKERS", 3):
+        results = await amake_cose_codes(items)
+
+    assert batches == [items[0:3], items[3:6], items[6:7]]
+    assert [filename for filename, _ in results] == [
+        make_image_filename(iss, product, id, "signed" if valid else "invalid")
+        for iss, product, id, valid in items
+    ]
+    assert len(fake_make_image) == len(items)
+
+
+# Ensure the QR code is drawn exactly like the qrcode library's StyledPilImage would. A pure black background isn't
+# compared, StyledPilImage paints the modules black before coloring them and can't tell them apart from it.
+@pytest.mark.parametrize("front_color,back_color", [
+    ((0, 0, 0), (255, 255, 255)),
+    ((12, 34, 156), (250, 240, 200)),
+    ((255, 220, 0), (20, 20, 60)),
+])
+def test_make_qr_image(front_color: tuple[int, int, int], back_color: tuple[int, int, int]):
+    qr = qrcode.QRCode(error_correction=CORRECTIONS["Q"], border=0)
+    qr.add_data(b"IT1:0123456789ABCDEF")
+    qr.make(fit=True)
+
+    expected = qr.make_image(
+        image_factory=StyledPilImage,
+        color_mask=SolidFillColorMask(front_color=front_color, back_color=back_color),
+    ).get_image()
+    img = make_qr_image(qr, front_color, back_color)
+
+    assert img.mode == expected.mode
+    assert img.size == expected.size
+    assert ImageChops.difference(img, expected).getbbox() is None
+
+
+class _BrokenPool(Executor):
+    """
+    Pool as it is after one of its workers died.
+    """
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        future = Future()
+        future.set_exception(BrokenProcessPool("A worker died"))
+        return future
+
+
+class _InProcessPool(Executor):
+    def __init__(self, **kwargs):
+        pass
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+# Ensure a broken worker pool is replaced instead of failing every request from then on
+async def test_run_cpu_bound_broken_pool():
+    with patch('app.tag.CPU_POOL', _BrokenPool()), patch('app.tag.ProcessPoolExecutor', _InProcessPool):
+        assert await run_cpu_bound(slugify, "Hello World") == "hello-world"
+        assert isinstance(app.tag.CPU_POOL, _InProcessPool)
+
+
+# Ensure codes can be given as the bytes they were received as
+def test_ioxio_tag_str_to_cose_bytes_bytes():
+    assert ioxio_tag_str_to_cose_bytes(TEST_CODE.encode("ascii")) == ioxio_tag_str_to_cose_bytes(TEST_CODE)
+
+
+@pytest.mark.parametrize("code,error", [
+    (b"IT2:" + TEST_CODE[4:].encode("ascii"), "missing version identifier"),
+    (TEST_CODE[4:].encode("ascii"), "missing version identifier"),
+    (b"IT1:" + TEST_CODE[4:].encode("ascii") + b"1", "failed Base45 decode"),
+    (b"IT1:bb8", "failed Base45 decode"),
+    ("IT1:BB8ä".encode("utf-8"), "failed Base45 decode"),
+])
+def test_ioxio_tag_str_to_cose_bytes_bytes_invalid(code: bytes, error: str):
+    with pytest.raises(TagsError) as e:
+        ioxio_tag_str_to_cose_bytes(code)
+    assert error in e.value.error
+    assert e.value.code == "signature_verification_failed"
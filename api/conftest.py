@@ -7,6 +7,10 @@ from httpx import AsyncClient, Response
 
 import pytest
 from main import app
+# Imported after main, as importing app.tag on its own is a circular import
+from app.dataproduct import get_dataspace_configuration, get_product_gateway_paths
+from app.tag import JWKS_REFRESHED_AT, get_cose_key, get_product_metadata, get_product_passport
+from app.utils import fetch_json_file_cached
 from settings import conf
 from testdata import TEST_QR_IMG, TEST_FAKE_HOSTED_FILES
 
@@ -47,11 +51,16 @@ async def client():
 
 @pytest.fixture
 async def fake_make_image():
+    # The payloads of the generated codes, so tests can check them
+    payloads = []
+
     def _make_image(payload: bytes, frame_type: str) -> bytes:
+        payloads.append(payload)
         return TEST_QR_IMG
 
-    with patch('app.tag.make_image', _make_image):
-        yield
+    # Worker processes wouldn't see the patch, so generate in this process
+    with patch('app.tag.make_image', _make_image), patch('app.tag.CPU_POOL', None):
+        yield payloads
 
 
 @pytest.fixture
@@ -62,8 +71,23 @@ async def fake_hosting():
 
         raise NotImplementedError(f"Unexpected request to fetch {url}, which we have no test data for")
 
+    def _clear_caches():
+        for cached in (
+                get_product_passport,
+                get_product_metadata,
+                get_cose_key,
+                fetch_json_file_cached,
+                get_dataspace_configuration,
+                get_product_gateway_paths,
+        ):
+            cached.cache_clear()
+        JWKS_REFRESHED_AT.clear()
+
+    # Don't let cached results from other tests hide the fake hosted files
+    _clear_caches()
     with patch('app.utils.fetch_json_file', _fetch_json_file):
         yield
+    _clear_caches()
 
 
 @pytest.fixture
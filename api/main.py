@@ -5,6 +5,7 @@ from fastapi_standalone_docs import StandaloneDocs
 from app.log import inject_request_id_middleware, logger
 from app.routes.dataproduct import router as dataproduct_router
 from app.routes.tag import router as tag_router
+from app.tag import start_cpu_pool, stop_cpu_pool
 from settings import conf
 
 APP_KWARGS = {}
@@ -75,3 +76,9 @@ async def add_security_headers(request: Request, call_next):
 @app.on_event("startup")
 async def setup():
     logger.info(f"Starting api for {conf.ENV} environment")
+    start_cpu_pool()
+
+
+@app.on_event("shutdown")
+async def teardown():
+    stop_cpu_pool()
@@ -11,18 +11,24 @@ from jose import jwk, constants
 
 # Add .. to path to load settings.py
 sys.path.append(str(Path(__file__).parent.parent))
-import settings
+from settings import conf
 
 app = typer.Typer()
 
 
 @app.command()
 def main():
-    print(f"Generating JWKS file for public key")
+    print(f"Generating JWKS file for public keys")
 
-    key = jwk.RSAKey(algorithm=constants.ALGORITHMS.RS256, key=settings.RSA_PUBLIC_KEY)
+    rsa_key = jwk.RSAKey(algorithm=constants.ALGORITHMS.RS256, key=conf.RSA_PRIVATE_KEY).public_key()
+    keys = [{**rsa_key.to_dict(), "kid": conf.RSA_KID}]
 
-    raw_data = {"keys": [key.to_dict()]}
+    # Codes are signed with the EC key when it's configured, so it needs to be published as well
+    if conf.EC_PRIVATE_KEY:
+        ec_key = jwk.ECKey(algorithm=constants.ALGORITHMS.ES256, key=conf.EC_PRIVATE_KEY).public_key()
+        keys.append({**ec_key.to_dict(), "kid": conf.EC_KID})
+
+    raw_data = {"keys": keys}
     print(raw_data)
 
     json_data = json.dumps(raw_data, indent=2)
@@ -1,6 +1,7 @@
 from pathlib import Path
 from typing import Literal, Optional
 
+from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -23,12 +24,35 @@ class Settings(BaseSettings):
     RSA_ISS: str = "tags.ioxio.dev"  # Base domain
     RSA_PRIVATE_KEY: str = ""
 
+    # ES256 (P-256) key for signing, preferred over the RSA key when configured
+    EC_KID: str = "02"  # Key ID in JWKS
+    EC_PRIVATE_KEY: str = ""
+
     QR_CORRECTION_LEVEL: str = "Q"  # L = ~7%, M = ~15%, Q = ~25%, H = ~30%
+    # Fixed mask pattern (0-7) to skip scoring all 8 masks for the best one on every code, None to score them
+    QR_MASK_PATTERN: Optional[int] = Field(None, ge=0, le=7)
 
     # RGB tuples
     QR_BACKGROUND: tuple[int, int, int] = (255, 255, 255)  # White
     QR_FOREGROUND: tuple[int, int, int] = (0, 0, 0)  # Black
 
+    # How many generated tag images to keep in memory for repeated payloads
+    QR_IMAGE_CACHE_SIZE: int = 256
+
+    # How long fetched issuer metadata and keys are cached, in seconds
+    METADATA_CACHE_TTL: int = 300
+
+    # Minimum time between refetching a JWKS before its cache expires, when a code's key is missing from it or the
+    # signature fails to verify, in seconds
+    JWKS_REFRESH_INTERVAL: int = 60
+
+    # Dataspace configuration and definitions change rarely, so they are cached for longer
+    DATASPACE_CACHE_TTL: int = 600
+
+    # Worker processes each API process starts for generating tags, None for one per available CPU up to 2, 0 to
+    # generate them in-process. Lower this when running several API processes on the same machine.
+    TAG_WORKERS: Optional[int] = Field(None, ge=0)
+
     # Set to e.g. http://localhost:8000 for local testing
     OVERRIDE_ISSUER_BASE_URL: Optional[str] = None
 
@@ -46,3 +70,6 @@ conf = Settings()
 if conf.is_local_env():
     conf.LOG_LEVEL = "DEBUG"
     conf.RSA_PRIVATE_KEY = (Path(__file__).parent / "demo_key_private.pem").read_text(encoding="utf-8")
+    ec_key_path = Path(__file__).parent / "demo_key_ec_private.pem"
+    if ec_key_path.exists():
+        conf.EC_PRIVATE_KEY = ec_key_path.read_text(encoding="utf-8")